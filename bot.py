@@ -1,19 +1,32 @@
 import os
 import io
+import time
+import asyncio
+import itertools
+import json
 import logging
+import signal
+import sqlite3
+import multiprocessing
+from collections import OrderedDict
 from datetime import date
 
 from telegram import (
+    Bot,
     Update,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
 )
+from telegram.error import RetryAfter
 from telegram.ext import (
     ApplicationBuilder,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
     ContextTypes,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    Updater,
     filters,
 )
 from deep_translator import GoogleTranslator
@@ -31,9 +44,39 @@ BOT_TOKEN = os.environ.get("BOT_TOKEN")
 BASE_URL = os.environ.get("BASE_URL", "https://bratik.onrender.com")
 PORT = int(os.environ.get("PORT", "10000"))
 
+# лимиты исходящих запросов к Telegram (официально ~30 msg/s всего,
+# ~1 msg/s в личный чат и ~20 msg/min в группу)
+SEND_RATE_GLOBAL = float(os.environ.get("SEND_RATE_GLOBAL", "30"))
+SEND_RATE_CHAT = float(os.environ.get("SEND_RATE_CHAT", "1"))
+SEND_BURST_CHAT = int(os.environ.get("SEND_BURST_CHAT", "3"))
+SEND_RATE_GROUP_PER_MIN = float(os.environ.get("SEND_RATE_GROUP_PER_MIN", "20"))
+SEND_MAX_RETRIES = int(os.environ.get("SEND_MAX_RETRIES", "3"))
+# сколько апдейтов разных пользователей обрабатываются одновременно
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "64"))
+
+# кэши переводов и озвучки (mp3 ~ 10–30 КБ на фразу)
+TRANSLATION_CACHE_SIZE = int(os.environ.get("TRANSLATION_CACHE_SIZE", "5000"))
+TTS_CACHE_SIZE = int(os.environ.get("TTS_CACHE_SIZE", "1000"))
+
+# разговорник курсов: {"a1": {"de_ru": ["Guten Morgen", ...]}, ...}
+PHRASEBOOK_PATH = os.environ.get("PHRASEBOOK_PATH", "phrasebook.json")
+PHRASEBOOK_DELAY = float(os.environ.get("PHRASEBOOK_DELAY", "1.5"))  # сек между фразами
+
+# WORKERS > 1: один процесс принимает webhook и раздаёт апдейты воркерам
+# по user_id; тарифы, направления и счётчики лежат в общей SQLite-базе
+WORKERS = int(os.environ.get("WORKERS", "1"))
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH") or (
+    "bot_state.sqlite3" if WORKERS > 1 else ""
+)
+
+# ID админов через запятую, им доступен /warmup
+ADMIN_IDS = {
+    int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()
+}
+
 # ------------------- состояние пользователей ------------------------
 
-USER_STATE: dict[int, dict] = {}
+USER_STATE: dict[int, dict] = {}  # заменяется на SqliteStore, если задан STATE_DB_PATH
 
 FRIEND_ID = 1300323894  # друг с безлимитом
 
@@ -55,6 +98,16 @@ TIER_NAMES = {
     "testweek": "Test week",
 }
 
+# чем меньше число, тем раньше уходят ответы при перегрузке
+TIER_SEND_PRIORITY = {
+    "vip": 0,
+    "b1": 1,
+    "a2": 2,
+    "a1": 3,
+    "testweek": 3,
+    "demo": 4,
+}
+
 # реальные пароли — только в коде, пользователю их не показываем
 PASSWORDS = {
     "karbofos-a1": "a1",
@@ -180,7 +233,20 @@ TEXTS = {
             "• Уровни доступа выдаются паролями (A1/A2/B1/PRO/testweek).\n"
             "• Лимиты обновляются каждый день автоматически.\n"
             "• Друг в Германии (ID 1300323894) имеет PRO-безлимит.\n"
+            "• /warmup [уровень] [направление] — заранее перевести и озвучить фразы разговорника.\n"
+            "• /warmup status — прогресс, /warmup stop — остановить.\n"
+        ),
+        "admin_only": "Команда доступна только администраторам.",
+        "warmup_no_phrases": "В разговорнике нет фраз для: {what}",
+        "warmup_running": "Прогрев уже идёт. /warmup status — прогресс, /warmup stop — остановить.",
+        "warmup_idle": "Прогрев сейчас не запущен.",
+        "warmup_stopping": "Останавливаю прогрев…",
+        "warmup_progress": (
+            "📚 Разговорник: {done}/{total}\n"
+            "Новых: {new}, уже в кэше: {skipped}, ошибок: {failed}"
         ),
+        "warmup_done": "✅ Прогрев завершён.",
+        "warmup_stopped": "⏹ Прогрев остановлен.",
         "speech_fail": "Не удалось распознать речь. Попробуй ещё раз, говори ближе к микрофону.",
         "original": "Оригинал",
         "translation": "Перевод",
@@ -254,7 +320,20 @@ TEXTS = {
             "Access levels are controlled via passwords (A1/A2/B1/PRO/testweek).\n"
             "Daily limits reset automatically each day.\n"
             "Your friend in Germany (ID 1300323894) has PRO unlimited plan.\n"
+            "/warmup [level] [direction] — pre-translate and voice phrasebook phrases.\n"
+            "/warmup status — progress, /warmup stop — stop it.\n"
         ),
+        "admin_only": "This command is for admins only.",
+        "warmup_no_phrases": "No phrasebook phrases for: {what}",
+        "warmup_running": "Warm-up is already running. /warmup status — progress, /warmup stop — stop.",
+        "warmup_idle": "Warm-up is not running.",
+        "warmup_stopping": "Stopping warm-up…",
+        "warmup_progress": (
+            "📚 Phrasebook: {done}/{total}\n"
+            "New: {new}, already cached: {skipped}, errors: {failed}"
+        ),
+        "warmup_done": "✅ Warm-up finished.",
+        "warmup_stopped": "⏹ Warm-up stopped.",
         "speech_fail": "Couldn’t recognize speech. Please try again.",
         "original": "Original",
         "translation": "Translation",
@@ -285,6 +364,7 @@ def get_user_state(user_id: int) -> dict:
     if st["date"] != today:
         st["date"] = today
         st["used_today"] = 0
+        USER_STATE[user_id] = st
     return st
 
 
@@ -537,6 +617,170 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
 
+# ------------------- общее хранилище (SQLite) ------------------------
+
+USER_FIELDS = ("tier", "used_today", "date", "direction", "ui_lang")
+
+
+class SqliteStore:
+    # ведёт себя как USER_STATE (get / []=) и хранит закреплённые фразы
+    # разговорника, чтобы их видели все процессы
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id INTEGER PRIMARY KEY, tier TEXT, used_today INTEGER, "
+            "date TEXT, direction TEXT, ui_lang TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS phrase_cache ("
+            "kind TEXT, key TEXT, value BLOB, PRIMARY KEY (kind, key))"
+        )
+
+    def get(self, user_id: int, default=None):
+        row = self._db.execute(
+            f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if row is None:
+            return default
+        return dict(zip(USER_FIELDS, row))
+
+    def __setitem__(self, user_id: int, st: dict) -> None:
+        self._db.execute(
+            "INSERT INTO users (user_id, tier, used_today, date, direction, ui_lang) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET tier = excluded.tier, "
+            "used_today = excluded.used_today, date = excluded.date, "
+            "direction = excluded.direction, ui_lang = excluded.ui_lang",
+            (user_id, *(st[f] for f in USER_FIELDS)),
+        )
+
+    def cache_get(self, kind: str, key: tuple):
+        row = self._db.execute(
+            "SELECT value FROM phrase_cache WHERE kind = ? AND key = ?",
+            (kind, json.dumps(key, ensure_ascii=False)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def cache_put(self, kind: str, key: tuple, value) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO phrase_cache (kind, key, value) VALUES (?, ?, ?)",
+            (kind, json.dumps(key, ensure_ascii=False), value),
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def init_shared_state(path: str) -> None:
+    global USER_STATE
+    store = SqliteStore(path)
+    USER_STATE = store
+    TRANSLATION_CACHE.store = store
+    TTS_CACHE.store = store
+    logger.info("User state and phrasebook cache in %s", path)
+
+
+# ------------------- кэш переводов и озвучки -------------------------
+
+
+class LRUCache:
+    def __init__(self, max_items: int, kind: str) -> None:
+        self.max_items = max_items  # лимит только для обычных записей
+        self.kind = kind
+        self.store: SqliteStore | None = None  # общий кэш фраз разговорника
+        self._data: OrderedDict = OrderedDict()
+        # фразы разговорника лежат отдельно: не вытесняются и не занимают
+        # место обычного трафика, их число ограничено самим разговорником
+        self._pinned: dict = {}
+
+    def get(self, key):
+        value = self._pinned.get(key)
+        if value is not None:
+            return value
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+            return value
+        if self.store is not None:
+            value = self.store.cache_get(self.kind, key)
+            if value is not None:
+                self._pinned[key] = value
+        return value
+
+    def put(self, key, value, pinned: bool = False) -> None:
+        if pinned:
+            self._data.pop(key, None)
+            self._pinned[key] = value
+            if self.store is not None:
+                self.store.cache_put(self.kind, key, value)
+            return
+        if key in self._pinned:
+            self._pinned[key] = value
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def pin(self, key) -> None:
+        if key in self._data:
+            self.put(key, self._data[key], pinned=True)
+
+
+TRANSLATION_CACHE = LRUCache(TRANSLATION_CACHE_SIZE, "translation")  # (src, dst, фраза) -> перевод
+TTS_CACHE = LRUCache(TTS_CACHE_SIZE, "tts")  # (язык, текст) -> mp3
+
+
+def phrase_key(text: str) -> str:
+    # знаки в конце не трогаем: вопрос и утверждение переводятся по-разному
+    return " ".join(text.split())
+
+
+def spoken_key(src: str, dst: str, text: str) -> tuple:
+    # распознанная речь приходит без знаков в конце, а в разговорнике они
+    # есть; такие ключи заводятся только для фраз разговорника
+    return (src, dst, "spoken", phrase_key(text).rstrip(".!?…"))
+
+
+def translate_uncached(src: str, dst: str, text: str) -> str:
+    return GoogleTranslator(source=src, target=dst).translate(text)
+
+
+def tts_uncached(text: str, lang: str) -> bytes:
+    buf = io.BytesIO()
+    gTTS(text, lang=lang).write_to_fp(buf)
+    return buf.getvalue()
+
+
+# кэш читается и пишется только в потоке event loop (SQLite-соединение
+# привязано к нему), в отдельный поток уходит лишь сам сетевой вызов
+async def translate_cached(src: str, dst: str, text: str, spoken: bool = False) -> str:
+    if spoken:
+        translated = TRANSLATION_CACHE.get(spoken_key(src, dst, text))
+        if translated is not None:
+            return translated
+
+    key = (src, dst, phrase_key(text))
+    translated = TRANSLATION_CACHE.get(key)
+    if translated is None:
+        translated = await asyncio.to_thread(translate_uncached, src, dst, text)
+        TRANSLATION_CACHE.put(key, translated)
+    return translated
+
+
+async def tts_cached(text: str, lang: str) -> bytes:
+    key = (lang, text)
+    audio = TTS_CACHE.get(key)
+    if audio is None:
+        audio = await asyncio.to_thread(tts_uncached, text, lang)
+        TTS_CACHE.put(key, audio)
+    return audio
+
+
 # ------------------- лимиты и обработка сообщений --------------------
 
 
@@ -574,17 +818,14 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     )
 
     try:
-        translated = GoogleTranslator(source=src, target=dst).translate(text)
+        translated = await translate_cached(src, dst, text)
     except Exception:
         logger.exception("translate error")
         await update.effective_message.reply_text("Ошибка перевода.")
         return
 
     try:
-        tts = gTTS(translated, lang=dst)
-        buf = io.BytesIO()
-        tts.write_to_fp(buf)
-        buf.seek(0)
+        buf = io.BytesIO(await tts_cached(translated, dst))
         await update.effective_message.reply_voice(
             voice=buf,
             caption=(
@@ -598,6 +839,16 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await update.effective_message.reply_text(translated)
 
 
+def ogg_to_audio_data(recognizer: sr.Recognizer, ogg_bytes: bytes) -> sr.AudioData:
+    audio = AudioSegment.from_file(io.BytesIO(ogg_bytes), format="ogg")
+    wav_buf = io.BytesIO()
+    audio.export(wav_buf, format="wav")
+    wav_buf.seek(0)
+
+    with sr.AudioFile(wav_buf) as source:
+        return recognizer.record(source)
+
+
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     st = get_user_state(user.id)
@@ -614,18 +865,15 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     file = await context.bot.get_file(update.message.voice.file_id)
     ogg_bytes = await file.download_as_bytearray()
 
-    audio = AudioSegment.from_file(io.BytesIO(ogg_bytes), format="ogg")
-    wav_buf = io.BytesIO()
-    audio.export(wav_buf, format="wav")
-    wav_buf.seek(0)
-
+    # ffmpeg и распознавание блокируют — в отдельном потоке
     recognizer = sr.Recognizer()
-    with sr.AudioFile(wav_buf) as source:
-        audio_data = recognizer.record(source)
+    audio_data = await asyncio.to_thread(ogg_to_audio_data, recognizer, bytes(ogg_bytes))
 
     try:
         logger.info("Recognizing with locale=%s", locale)
-        text = recognizer.recognize_google(audio_data, language=locale)
+        text = await asyncio.to_thread(
+            recognizer.recognize_google, audio_data, language=locale
+        )
         logger.info("Recognized: %r", text)
     except Exception:
         logger.warning("Speech recognition failed", exc_info=True)
@@ -637,17 +885,14 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
 
     try:
-        translated = GoogleTranslator(source=src, target=dst).translate(text)
+        translated = await translate_cached(src, dst, text, spoken=True)
     except Exception:
         logger.exception("translate error")
         await update.effective_message.reply_text("Ошибка перевода.")
         return
 
     try:
-        tts = gTTS(translated, lang=dst)
-        buf = io.BytesIO()
-        tts.write_to_fp(buf)
-        buf.seek(0)
+        buf = io.BytesIO(await tts_cached(translated, dst))
         await update.effective_message.reply_voice(
             voice=buf,
             caption=(
@@ -661,20 +906,490 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.effective_message.reply_text(translated)
 
 
-# ------------------- main -------------------------------------------
+# ------------------- разговорник курсов ------------------------------
 
+WARMUP: dict = {
+    "task": None,
+    "total": 0,
+    "done": 0,
+    "new": 0,
+    "skipped": 0,
+    "failed": 0,
+}
 
-def main() -> None:
-    if not BOT_TOKEN:
-        raise RuntimeError("BOT_TOKEN env is not set")
+
+def load_phrasebook(tier: str | None, direction: str | None) -> list[tuple[str, str]]:
+    with open(PHRASEBOOK_PATH, encoding="utf-8") as f:
+        book = json.load(f)
+
+    items = []
+    seen = set()
+    for book_tier, by_direction in book.items():
+        if tier and book_tier != tier:
+            continue
+        if book_tier not in TIER_NAMES:
+            logger.warning("phrasebook: unknown tier %r skipped", book_tier)
+            continue
+        for book_dir, phrases in by_direction.items():
+            if direction and book_dir != direction:
+                continue
+            if book_dir not in DIRECTIONS:
+                logger.warning("phrasebook: unknown direction %r skipped", book_dir)
+                continue
+            for phrase in phrases:
+                key = (book_dir, phrase_key(phrase))
+                if not key[1] or key in seen:
+                    continue
+                seen.add(key)
+                items.append((book_dir, phrase))
+    return items
+
+
+def is_phrase_cached(src: str, dst: str, phrase: str) -> bool:
+    key = (src, dst, phrase_key(phrase))
+    translated = TRANSLATION_CACHE.get(key)
+    if translated is None or TTS_CACHE.get((dst, translated)) is None:
+        return False
+    TRANSLATION_CACHE.pin(key)
+    TTS_CACHE.pin((dst, translated))
+    alias = spoken_key(src, dst, phrase)
+    if TRANSLATION_CACHE.get(alias) is None:
+        TRANSLATION_CACHE.put(alias, translated, pinned=True)
+    return True
+
+
+async def precompute_phrase(src: str, dst: str, phrase: str) -> None:
+    # сеть и gTTS блокируют, поэтому в отдельном потоке — ученики не ждут
+    translated = await asyncio.to_thread(translate_uncached, src, dst, phrase)
+    audio = await asyncio.to_thread(tts_uncached, translated, dst)
+    TRANSLATION_CACHE.put((src, dst, phrase_key(phrase)), translated, pinned=True)
+    TRANSLATION_CACHE.put(spoken_key(src, dst, phrase), translated, pinned=True)
+    TTS_CACHE.put((dst, translated), audio, pinned=True)
+
+
+def warmup_progress_text(user_id: int) -> str:
+    return t(
+        user_id,
+        "warmup_progress",
+        done=WARMUP["done"],
+        total=WARMUP["total"],
+        new=WARMUP["new"],
+        skipped=WARMUP["skipped"],
+        failed=WARMUP["failed"],
+    )
+
+
+async def run_warmup(bot, user_id: int, items: list[tuple[str, str]]) -> None:
+    WARMUP.update(total=len(items), done=0, new=0, skipped=0, failed=0)
+    msg = None
+    last_report = time.monotonic()
+    final_key = "warmup_done"
+
+    try:
+        try:
+            msg = await bot.send_message(user_id, warmup_progress_text(user_id))
+        except Exception as e:
+            # без сообщения прогресса прогрев всё равно идёт, см. /warmup status
+            logger.warning("send_message failed: %s", e)
+
+        for direction, phrase in items:
+            src, dst = DIRECTIONS[direction]
+            if is_phrase_cached(src, dst, phrase):
+                WARMUP["skipped"] += 1
+            else:
+                try:
+                    await precompute_phrase(src, dst, phrase)
+                    WARMUP["new"] += 1
+                except Exception:
+                    logger.warning(
+                        "warmup failed for %r (%s)", phrase, direction, exc_info=True
+                    )
+                    WARMUP["failed"] += 1
+                await asyncio.sleep(PHRASEBOOK_DELAY)
+            WARMUP["done"] += 1
+
+            if msg is not None and time.monotonic() - last_report >= 5:
+                last_report = time.monotonic()
+                try:
+                    await bot.edit_message_text(
+                        warmup_progress_text(user_id),
+                        chat_id=user_id,
+                        message_id=msg.message_id,
+                    )
+                except Exception as e:
+                    logger.warning("edit_message_text failed: %s", e)
+    except asyncio.CancelledError:
+        final_key = "warmup_stopped"
+        raise
+    finally:
+        WARMUP["task"] = None
+        logger.info(
+            "Warmup finished: %s/%s, new=%s, skipped=%s, failed=%s",
+            WARMUP["done"],
+            WARMUP["total"],
+            WARMUP["new"],
+            WARMUP["skipped"],
+            WARMUP["failed"],
+        )
+        if msg is not None:
+            try:
+                await bot.edit_message_text(
+                    f"{t(user_id, final_key)}\n{warmup_progress_text(user_id)}",
+                    chat_id=user_id,
+                    message_id=msg.message_id,
+                )
+            except Exception as e:
+                logger.warning("edit_message_text failed: %s", e)
+
+
+async def cmd_warmup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user.id not in ADMIN_IDS:
+        await update.effective_message.reply_text(t(user.id, "admin_only"))
+        return
+
+    args = [a.lower() for a in context.args or []]
+    task = WARMUP["task"]
+
+    if args and args[0] == "status":
+        if task is None:
+            await update.effective_message.reply_text(t(user.id, "warmup_idle"))
+        else:
+            await update.effective_message.reply_text(warmup_progress_text(user.id))
+        return
+
+    if args and args[0] == "stop":
+        if task is None:
+            await update.effective_message.reply_text(t(user.id, "warmup_idle"))
+        else:
+            task.cancel()
+            await update.effective_message.reply_text(t(user.id, "warmup_stopping"))
+        return
+
+    if task is not None:
+        await update.effective_message.reply_text(t(user.id, "warmup_running"))
+        return
+
+    tier = next((a for a in args if a in TIER_NAMES), None)
+    direction = next((a for a in args if a in DIRECTIONS), None)
+
+    try:
+        items = load_phrasebook(tier, direction)
+    except (OSError, ValueError, AttributeError, TypeError):
+        logger.exception("phrasebook load error")
+        items = []
+
+    if not items:
+        what = " ".join(filter(None, [tier, direction])) or PHRASEBOOK_PATH
+        await update.effective_message.reply_text(
+            t(user.id, "warmup_no_phrases", what=what)
+        )
+        return
 
     logger.info(
-        "Запускаю webhook на %s, порт %s",
-        f"{BASE_URL}",
-        PORT,
+        "Warmup started by %s: %s phrases (tier=%s, direction=%s)",
+        user.id,
+        len(items),
+        tier,
+        direction,
     )
+    # не через application.create_task: stop() ждал бы конца всего прогрева
+    WARMUP["task"] = asyncio.create_task(run_warmup(context.bot, user.id, items))
+
+
+async def stop_warmup(application) -> None:
+    # при остановке бота прогрев отменяется, уже готовые фразы остаются в кэше
+    task = WARMUP["task"]
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+# ------------------- очередь исходящих запросов ----------------------
+
+# редактирования одного и того же сообщения: в очереди нужна только последняя
+EDIT_ENDPOINTS = {"editMessageText", "editMessageReplyMarkup", "editMessageCaption"}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        if now < self.stamp:  # пауза по retry_after
+            return self.stamp - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        # до конца паузы не пополняется, сразу после — ровно одна отправка
+        self.tokens = 1
+        self.stamp = max(self.stamp, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0.0 and self.tokens >= self.capacity
+
+
+class PendingSend:
+    __slots__ = ("priority", "seq", "chat_id", "future", "superseded")
+
+    def __init__(self, priority: int, seq: int, chat_id, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.superseded = False
+
+
+# общий и по-чатовый token bucket, приоритет по тарифу, пауза по retry_after
+class SendScheduler(BaseRateLimiter[int]):
+    def __init__(
+        self,
+        overall_rate: float = SEND_RATE_GLOBAL,
+        chat_rate: float = SEND_RATE_CHAT,
+        chat_burst: int = SEND_BURST_CHAT,
+        group_rate_per_min: float = SEND_RATE_GROUP_PER_MIN,
+        max_retries: int = SEND_MAX_RETRIES,
+    ) -> None:
+        self._overall = TokenBucket(overall_rate, max(overall_rate, 1))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._group_rate = group_rate_per_min / 60
+        self._max_retries = max_retries
+        self._chats: dict = {}
+        self._waiting: list[PendingSend] = []
+        self._edits: dict[tuple, PendingSend] = {}
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: asyncio.Event | None = None
+        self._pump_task: asyncio.Task | None = None
+
+    async def initialize(self) -> None:
+        self._ensure_pump()
+
+    async def shutdown(self) -> None:
+        if self._pump_task:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for entry in self._waiting:
+            entry.future.cancel()
+        self._waiting.clear()
+        self._edits.clear()
+
+    def _ensure_pump(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket | None:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                self._chats = {
+                    k: b for k, b in self._chats.items() if not b.is_idle(now)
+                }
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self._group_rate, self._chat_burst)
+            else:
+                bucket = TokenBucket(self._chat_rate, self._chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    @staticmethod
+    def _priority_for(chat_id) -> int:
+        lowest = max(TIER_SEND_PRIORITY.values())
+        st = USER_STATE.get(chat_id) if isinstance(chat_id, int) else None
+        if not st:
+            return lowest
+        return TIER_SEND_PRIORITY.get(st["tier"], lowest)
+
+    async def _pump(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            delay = None
+
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            else:
+                self._waiting.sort(key=lambda e: (e.priority, e.seq))
+                remaining = []
+                for entry in self._waiting:
+                    if entry.future.done():
+                        continue
+                    wait = self._overall.wait_time(now)
+                    if wait > 0:
+                        delay = wait if delay is None else min(delay, wait)
+                        remaining.append(entry)
+                        continue
+                    bucket = self._chat_bucket(entry.chat_id, now)
+                    if bucket is not None:
+                        wait = bucket.wait_time(now)
+                        if wait > 0:
+                            delay = wait if delay is None else min(delay, wait)
+                            remaining.append(entry)
+                            continue
+                        bucket.take()
+                    self._overall.take()
+                    entry.future.set_result(None)
+                self._waiting = remaining
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _enqueue(self, priority: int, chat_id) -> PendingSend:
+        self._ensure_pump()
+        future = asyncio.get_running_loop().create_future()
+        entry = PendingSend(priority, next(self._seq), chat_id, future)
+        self._waiting.append(entry)
+        self._wakeup.set()
+        return entry
+
+    def _pause(self, chat_id, seconds: float) -> None:
+        # флуд-лимит одного чата не должен останавливать ответы остальным
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id, now)
+        if bucket is not None:
+            bucket.pause(now, seconds)
+        else:
+            self._paused_until = max(self._paused_until, now + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def process_request(
+        self,
+        callback,
+        args,
+        kwargs,
+        endpoint,
+        data,
+        rate_limit_args,
+    ):
+        chat_id = data.get("chat_id")
+        if isinstance(rate_limit_args, int):
+            priority = rate_limit_args
+        else:
+            priority = self._priority_for(chat_id)
+
+        edit_key = None
+        if endpoint in EDIT_ENDPOINTS:
+            edit_key = (
+                endpoint,
+                chat_id,
+                data.get("message_id"),
+                data.get("inline_message_id"),
+            )
+
+        for attempt in range(self._max_retries + 1):
+            entry = self._enqueue(priority, chat_id)
+            if edit_key is not None:
+                older = self._edits.get(edit_key)
+                if older is not None and not older.future.done():
+                    older.superseded = True
+                    older.future.set_result(None)
+                self._edits[edit_key] = entry
+            try:
+                await entry.future
+            finally:
+                if edit_key is not None and self._edits.get(edit_key) is entry:
+                    del self._edits[edit_key]
+
+            if entry.superseded:
+                logger.info("%s for chat %s superseded, dropped", endpoint, chat_id)
+                return True
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self._max_retries:
+                    raise
+                logger.warning(
+                    "%s flood limit, retry after %ss (chat %s)",
+                    endpoint,
+                    e.retry_after,
+                    chat_id,
+                )
+                self._pause(chat_id, float(e.retry_after))
+
+
+# апдейты разных пользователей обрабатываются параллельно (ожидание в
+# очереди отправки одного чата не держит остальных), одного — строго по порядку
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY) -> None:
+        super().__init__(max_concurrent_updates)
+        self._users: dict = {}  # ключ -> [lock, сколько апдейтов ждут]
+
+    @staticmethod
+    def _user_key(update):
+        if not isinstance(update, Update):
+            return None
+        user = update.effective_user
+        chat = update.effective_chat
+        return user.id if user else (chat.id if chat else None)
+
+    async def process_update(self, update, coroutine) -> None:
+        key = self._user_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._users.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # лок берётся до семафора, чтобы очередь одного пользователя
+            # не занимала все слоты
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._users[key]
+
+    async def do_process_update(self, update, coroutine) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+# ------------------- несколько процессов ----------------------------
 
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+
+def build_application(overall_rate: float):
+    application = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .rate_limiter(SendScheduler(overall_rate=overall_rate))
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_stop(stop_warmup)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", cmd_start))
     application.add_handler(CommandHandler("lang", cmd_lang))
@@ -685,6 +1400,7 @@ def main() -> None:
     application.add_handler(CommandHandler("groupinfo", cmd_groupinfo))
     application.add_handler(CommandHandler("help", cmd_help))
     application.add_handler(CommandHandler("adminhelp", cmd_adminhelp))
+    application.add_handler(CommandHandler("warmup", cmd_warmup))
 
     application.add_handler(CallbackQueryHandler(on_callback))
 
@@ -692,7 +1408,143 @@ def main() -> None:
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text)
     )
     application.add_handler(MessageHandler(filters.VOICE, handle_voice))
+    return application
+
+
+def worker_index(update: Update) -> int:
+    # все апдейты одного пользователя идут в один воркер: порядок сообщений
+    # и счётчик лимита не зависят от других процессов
+    # состояние прогрева живёт в процессе, поэтому все /warmup — в воркер 0:
+    # у всех админов один статус и не больше одного прогрева одновременно
+    message = update.effective_message
+    if message and message.text:
+        command = message.text.split(maxsplit=1)[0].split("@", 1)[0].lower()
+        if command == "/warmup":
+            return 0
+
+    user = update.effective_user
+    chat = update.effective_chat
+    key = user.id if user else (chat.id if chat else update.update_id)
+    return key % WORKERS
+
+
+async def worker_loop(index: int, queue) -> None:
+    # общий лимит Telegram делится между воркерами
+    application = build_application(SEND_RATE_GLOBAL / WORKERS)
+    async with application:
+        await application.start()
+        logger.info("Worker %s ready", index)
+        while True:
+            data = await asyncio.to_thread(queue.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        await stop_warmup(application)
+        await application.stop()
+    logger.info("Worker %s stopped", index)
+
+
+def run_worker(index: int, queue, db_path: str) -> None:
+    # останавливается по None из очереди, когда фронт дослал все апдейты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    init_shared_state(db_path)
+    asyncio.run(worker_loop(index, queue))
+
+
+async def front_loop(start_worker, queues: list) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    update_queue: asyncio.Queue = asyncio.Queue()
+    updater = Updater(Bot(BOT_TOKEN), update_queue)
+    async with updater:
+        await updater.start_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path="webhook",
+            webhook_url=f"{BASE_URL}/webhook",
+        )
+        while not stop.is_set():
+            try:
+                update = await asyncio.wait_for(update_queue.get(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            route_update(update, start_worker, queues)
+        await updater.stop()
+
+        # Telegram уже получил 200 на эти апдейты, терять их нельзя
+        while not update_queue.empty():
+            route_update(update_queue.get_nowait(), start_worker, queues)
+
+
+def route_update(update: Update, start_worker, queues: list) -> None:
+    index = worker_index(update)
+    start_worker(index)
+    queues[index].put(update.to_dict())
+
+
+def run_cluster() -> None:
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(WORKERS)]
+    procs: list = [None] * WORKERS
+
+    def start_worker(index: int) -> None:
+        proc = procs[index]
+        if proc is not None and proc.is_alive():
+            return
+        if proc is not None:
+            logger.warning("Worker %s died (exit %s), restarting", index, proc.exitcode)
+        proc = ctx.Process(
+            target=run_worker,
+            args=(index, queues[index], STATE_DB_PATH),
+            name=f"bot-worker-{index}",
+        )
+        proc.start()
+        procs[index] = proc
+
+    SqliteStore(STATE_DB_PATH).close()  # создаём таблицы до старта воркеров
+    for i in range(WORKERS):
+        start_worker(i)
+
+    try:
+        asyncio.run(front_loop(start_worker, queues))
+    finally:
+        for q in queues:
+            q.put(None)
+        for proc in procs:
+            proc.join(timeout=30)
+            if proc.is_alive():
+                # SIGTERM воркеры игнорируют, поэтому только kill
+                logger.warning("Worker %s did not stop in time, killing", proc.name)
+                proc.kill()
+                proc.join()
+
+
+# ------------------- main -------------------------------------------
+
+
+def main() -> None:
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN env is not set")
+
+    logger.info(
+        "Запускаю webhook на %s, порт %s, воркеров: %s",
+        f"{BASE_URL}",
+        PORT,
+        WORKERS,
+    )
+
+    if WORKERS > 1:
+        run_cluster()
+        return
+
+    if STATE_DB_PATH:
+        init_shared_state(STATE_DB_PATH)
 
+    application = build_application(SEND_RATE_GLOBAL)
     application.run_webhook(
         listen="0.0.0.0",
         port=PORT,
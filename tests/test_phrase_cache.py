@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    monkeypatch.setattr(bot, "TRANSLATION_CACHE", bot.LRUCache(2, "translation"))
+    monkeypatch.setattr(bot, "TTS_CACHE", bot.LRUCache(2, "tts"))
+    monkeypatch.setattr(bot, "WARMUP", dict(bot.WARMUP))
+    monkeypatch.setattr(bot, "PHRASEBOOK_DELAY", 0)
+    calls = []
+
+    def translate(src, dst, text):
+        calls.append(text)
+        return f"{dst}:{text}"
+
+    monkeypatch.setattr(bot, "translate_uncached", translate)
+    monkeypatch.setattr(bot, "tts_uncached", lambda text, lang: text.encode())
+    return calls
+
+
+def test_phrase_key_keeps_final_punctuation():
+    assert bot.phrase_key("  Du  kommst\nmorgen? ") == "Du kommst morgen?"
+    assert bot.phrase_key("Du kommst morgen?") != bot.phrase_key("Du kommst morgen.")
+
+
+def test_unpinned_entries_are_evicted_lru():
+    cache = bot.LRUCache(2, "x")
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_pinned_entries_do_not_use_lru_slots():
+    cache = bot.LRUCache(2, "x")
+    for i in range(5):
+        cache.put(("pinned", i), i, pinned=True)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.pin("b")
+    cache.put("c", 3)
+    cache.put("d", 4)
+
+    assert [cache.get(("pinned", i)) for i in range(5)] == [0, 1, 2, 3, 4]
+    assert cache.get("b") == 2
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    assert cache.get("d") == 4
+
+
+def test_translate_cached_hits(caches):
+    assert asyncio.run(bot.translate_cached("de", "ru", "Hallo")) == "ru:Hallo"
+    assert asyncio.run(bot.translate_cached("de", "ru", " Hallo ")) == "ru:Hallo"
+    assert caches == ["Hallo"]
+
+
+def test_warmup_rerun_only_processes_new_phrases(caches, tmp_path, monkeypatch):
+    path = tmp_path / "phrasebook.json"
+    monkeypatch.setattr(bot, "PHRASEBOOK_PATH", str(path))
+
+    class FakeBot:
+        async def send_message(self, chat_id, text):
+            return type("Msg", (), {"message_id": 1})()
+
+        async def edit_message_text(self, text, **kwargs):
+            pass
+
+    book = {"a1": {"de_ru": ["Guten Morgen!", "Wie heißt du?", "Guten Morgen!"]}}
+    path.write_text(json.dumps(book), encoding="utf-8")
+    asyncio.run(bot.run_warmup(FakeBot(), 1, bot.load_phrasebook(None, None)))
+    assert caches == ["Guten Morgen!", "Wie heißt du?"]
+
+    book["a1"]["de_ru"].append("Danke.")
+    book["zz"] = {"de_ru": ["ignored"]}
+    path.write_text(json.dumps(book), encoding="utf-8")
+    asyncio.run(bot.run_warmup(FakeBot(), 1, bot.load_phrasebook("a1", "de_ru")))
+    assert caches[2:] == ["Danke."]
+    assert bot.WARMUP["skipped"] == 2 and bot.WARMUP["new"] == 1
+    assert bot.WARMUP["task"] is None
+
+
+def test_voice_input_hits_warmed_phrase(caches):
+    asyncio.run(bot.precompute_phrase("de", "ru", "Guten Morgen!"))
+
+    # распознанная речь приходит без знака в конце
+    spoken = bot.translate_cached("de", "ru", "Guten Morgen", spoken=True)
+    assert asyncio.run(spoken) == "ru:Guten Morgen!"
+    assert asyncio.run(bot.tts_cached("ru:Guten Morgen!", "ru")) == b"ru:Guten Morgen!"
+    # набранный текст по-прежнему ищется по точному ключу
+    typed = bot.translate_cached("de", "ru", "Guten Morgen")
+    assert asyncio.run(typed) == "ru:Guten Morgen"
+    assert caches == ["Guten Morgen!", "Guten Morgen"]
+
+
+def test_warmup_survives_failed_progress_message(caches):
+    class NoChatBot:
+        async def send_message(self, chat_id, text):
+            raise RuntimeError("Forbidden: bot can't initiate conversation")
+
+        async def edit_message_text(self, text, **kwargs):
+            raise AssertionError("nothing to edit")
+
+    asyncio.run(bot.run_warmup(NoChatBot(), 1, [("de_ru", "Danke.")]))
+    assert caches == ["Danke."]
+    assert bot.WARMUP["new"] == 1
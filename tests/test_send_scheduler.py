@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+from telegram.error import RetryAfter
+
+import bot
+
+
+def test_bucket_refill_and_wait_time():
+    bucket = bot.TokenBucket(rate=2, capacity=3)
+    now = bucket.stamp
+
+    for _ in range(3):
+        assert bucket.wait_time(now) == 0.0
+        bucket.take()
+    assert bucket.wait_time(now) == 0.5
+    assert bucket.wait_time(now + 0.5) == 0.0
+    assert not bucket.is_idle(now + 0.5)
+    assert bucket.is_idle(now + 10)
+    assert bucket.tokens == 3  # больше ёмкости не копится
+
+
+def test_bucket_pause():
+    bucket = bot.TokenBucket(rate=1, capacity=3)
+    now = bucket.stamp
+
+    bucket.pause(now, 5)
+    assert bucket.wait_time(now + 1) == 4
+    assert bucket.wait_time(now + 5) == 0.0
+    bucket.take()
+    assert bucket.wait_time(now + 5) == 1.0
+
+
+def test_newer_edit_supersedes_pending_one():
+    async def scenario():
+        scheduler = bot.SendScheduler(overall_rate=100, chat_rate=1, chat_burst=1)
+        calls = []
+
+        async def send(i):
+            calls.append(i)
+            return i
+
+        data = {"chat_id": 5, "message_id": 1}
+        await scheduler.process_request(send, (0,), {}, "sendMessage", {"chat_id": 5}, None)
+        results = await asyncio.gather(
+            *[
+                scheduler.process_request(send, (i,), {}, "editMessageText", data, None)
+                for i in (1, 2, 3)
+            ]
+        )
+        await scheduler.shutdown()
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [True, True, 3]
+    assert calls == [0, 3]
+
+
+def test_retry_after_pauses_only_that_chat():
+    async def scenario():
+        scheduler = bot.SendScheduler(overall_rate=100)
+        attempts = []
+
+        async def flooded():
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) == 1:
+                raise RetryAfter(1)
+            return "flooded"
+
+        async def other():
+            return asyncio.get_running_loop().time()
+
+        start = asyncio.get_running_loop().time()
+        first = asyncio.create_task(
+            scheduler.process_request(flooded, (), {}, "sendVoice", {"chat_id": 7}, None)
+        )
+        await asyncio.sleep(0.05)
+        other_at = await scheduler.process_request(
+            other, (), {}, "sendMessage", {"chat_id": 8}, None
+        )
+        result = await first
+        await scheduler.shutdown()
+        return start, other_at, attempts, result
+
+    start, other_at, attempts, result = asyncio.run(scenario())
+    assert result == "flooded"
+    assert other_at - start < 0.5
+    assert attempts[1] - attempts[0] >= 0.9
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(user_id, "u", False)
+    chat = Chat(user_id, Chat.PRIVATE)
+    message = Message(update_id, None, chat, from_user=user, text=str(update_id))
+    return Update(update_id, message=message)
+
+
+def test_updates_of_one_user_stay_in_order():
+    async def scenario():
+        processor = bot.PerUserUpdateProcessor(max_concurrent_updates=8)
+        log = []
+
+        async def handle(update, delay):
+            await asyncio.sleep(delay)
+            log.append(update.update_id)
+
+        # у пользователя 1 первый апдейт самый медленный
+        jobs = [
+            (make_update(1, 1), 0.1),
+            (make_update(2, 1), 0),
+            (make_update(3, 2), 0),
+        ]
+        await asyncio.gather(
+            *[processor.process_update(u, handle(u, d)) for u, d in jobs]
+        )
+        return log, processor._users
+
+    log, users = asyncio.run(scenario())
+    assert log.index(1) < log.index(2)
+    assert log[0] == 3  # другой пользователь не ждал
+    assert users == {}
+
+
+def test_slow_translation_does_not_block_the_loop(monkeypatch):
+    monkeypatch.setattr(bot, "TRANSLATION_CACHE", bot.LRUCache(10, "translation"))
+
+    def slow_translate(src, dst, text):
+        time.sleep(0.3)
+        return text.upper()
+
+    monkeypatch.setattr(bot, "translate_uncached", slow_translate)
+
+    async def scenario():
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.05)
+
+        start = time.monotonic()
+        results = await asyncio.gather(
+            bot.translate_cached("de", "ru", "a"),
+            bot.translate_cached("de", "ru", "b"),
+            ticker(),
+        )
+        return results, time.monotonic() - start, ticks
+
+    results, elapsed, ticks = asyncio.run(scenario())
+    assert results[:2] == ["A", "B"]
+    assert elapsed < 0.5  # два вызова по 0.3 с идут параллельно
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.3
+
+
+class SchedulerBot:
+    # вместо сети: каждый запрос идёт через SendScheduler, как у ExtBot
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.sent = []
+
+    async def _request(self, endpoint, data, result):
+        async def call():
+            self.sent.append((endpoint, result))
+            return True
+
+        return await self.scheduler.process_request(call, (), {}, endpoint, data, None)
+
+    async def answer_callback_query(self, callback_query_id, **kwargs):
+        return True
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._request("sendMessage", {"chat_id": chat_id}, text)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        data = {"chat_id": chat_id, "message_id": message_id}
+        return await self._request("editMessageText", data, text)
+
+
+def test_group_callback_taps_supersede_pending_edit(monkeypatch):
+    # в личке правки одного сообщения идут по очереди (лок пользователя),
+    # а в группе одно сообщение с кнопками правят разные пользователи
+    monkeypatch.setattr(bot, "USER_STATE", {})
+
+    async def scenario():
+        scheduler = bot.SendScheduler(
+            overall_rate=100, chat_burst=1, group_rate_per_min=600
+        )
+        fake = SchedulerBot(scheduler)
+        processor = bot.PerUserUpdateProcessor(max_concurrent_updates=8)
+        chat = Chat(-100, Chat.GROUP)
+        keyboard = Message(1, None, chat)
+        keyboard.set_bot(fake)
+
+        await fake.send_message(-100, "keyboard")  # ведро группы пустое
+        updates = []
+        for user_id, direction in [(1, "de_ru"), (2, "en_de"), (3, "de_en")]:
+            query = CallbackQuery(
+                str(user_id),
+                User(user_id, "u", False),
+                "inst",
+                message=keyboard,
+                data=f"dir:{direction}",
+            )
+            query.set_bot(fake)
+            updates.append(Update(user_id, callback_query=query))
+
+        await asyncio.gather(
+            *[processor.process_update(u, bot.on_callback(u, None)) for u in updates]
+        )
+        await scheduler.shutdown()
+        return fake.sent
+
+    sent = asyncio.run(scenario())
+    edits = [text for endpoint, text in sent if endpoint == "editMessageText"]
+    assert len(edits) == 1
+    assert bot.DIRECTION_LABELS["de_en"] in edits[0]
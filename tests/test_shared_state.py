@@ -0,0 +1,99 @@
+import pytest
+from telegram import Chat, Message, Update, User
+
+import bot
+
+
+@pytest.fixture
+def shared_state(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.sqlite3")
+    monkeypatch.setattr(bot, "USER_STATE", {})
+    monkeypatch.setattr(bot, "TRANSLATION_CACHE", bot.LRUCache(10, "translation"))
+    monkeypatch.setattr(bot, "TTS_CACHE", bot.LRUCache(10, "tts"))
+    bot.init_shared_state(path)
+    yield path
+    bot.USER_STATE.close()
+
+
+def test_user_state_round_trip(shared_state):
+    st = bot.get_user_state(42)
+    st["tier"] = "a1"
+    st["direction"] = "de_ru"
+    bot.USER_STATE[42] = st
+
+    other = bot.SqliteStore(shared_state)
+    try:
+        assert other.get(42) == st
+        assert other.get(43) is None
+    finally:
+        other.close()
+
+
+def test_daily_limit_is_shared(shared_state, monkeypatch):
+    monkeypatch.setitem(bot.TIER_LIMITS_PER_DAY, "demo", 2)
+
+    assert [bot.increment_and_check_limit(42) for _ in range(3)] == [True, True, False]
+    other = bot.SqliteStore(shared_state)
+    try:
+        assert other.get(42)["used_today"] == 2
+    finally:
+        other.close()
+
+
+def test_pinned_phrases_are_visible_to_other_processes(shared_state):
+    bot.TRANSLATION_CACHE.put(("de", "ru", "Hallo"), "Привет", pinned=True)
+    bot.TTS_CACHE.put(("ru", "Привет"), b"mp3", pinned=True)
+    bot.TTS_CACHE.put(("ru", "Пока"), b"not shared")
+
+    other = bot.SqliteStore(shared_state)
+    try:
+        cache = bot.LRUCache(10, "tts")
+        cache.store = other
+        assert cache.get(("ru", "Привет")) == b"mp3"
+        assert cache.get(("ru", "Пока")) is None
+    finally:
+        other.close()
+
+
+def test_worker_index_is_stable_per_user(monkeypatch):
+    monkeypatch.setattr(bot, "WORKERS", 4)
+    user = User(1300323894, "u", False)
+    chat = Chat(-100, Chat.GROUP)
+
+    updates = [
+        Update(i, message=Message(i, None, chat, from_user=user, text="hi"))
+        for i in range(5)
+    ]
+    assert {bot.worker_index(u) for u in updates} == {1300323894 % 4}
+
+
+def test_route_update_sends_dict_to_the_user_worker(monkeypatch):
+    monkeypatch.setattr(bot, "WORKERS", 2)
+    started = []
+
+    class ListQueue(list):
+        def put(self, item):
+            self.append(item)
+
+    queues = [ListQueue(), ListQueue()]
+    user = User(3, "u", False)
+    update = Update(9, message=Message(9, None, Chat(3, Chat.PRIVATE), from_user=user))
+    bot.route_update(update, started.append, queues)
+
+    assert started == [1]
+    assert queues[0] == []
+    assert queues[1][0]["update_id"] == 9
+
+
+def test_warmup_commands_go_to_worker_zero(monkeypatch):
+    monkeypatch.setattr(bot, "WORKERS", 4)
+    chat = Chat(7, Chat.PRIVATE)
+
+    for user_id, text in [(7, "/warmup a1"), (5, "/warmup@bratik_bot status"), (3, "/WARMUP stop")]:
+        user = User(user_id, "admin", False)
+        update = Update(1, message=Message(1, None, chat, from_user=user, text=text))
+        assert bot.worker_index(update) == 0
+
+    user = User(7, "u", False)
+    update = Update(2, message=Message(2, None, chat, from_user=user, text="/warmups"))
+    assert bot.worker_index(update) == 3